@@ -1,9 +1,12 @@
-from os import path
-from flask import Flask
+from datetime import datetime
+from sqlite3 import Connection as SQLiteConnection
+from flask import Flask, flash, g
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_mail import Mail
 from flask_apscheduler import APScheduler
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine
 
 
 database = SQLAlchemy()
@@ -21,6 +24,14 @@ def create_app():
         f"sqlite:///{path.join('/database',DATABASE_NAME)}"  
     )"""  # To run this locally change to
     app.config["SQLALCHEMY_DATABASE_URI"] = f"sqlite:///{DATABASE_NAME}"
+    app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+        "pool_size": 10,
+        "max_overflow": 20,
+        "pool_pre_ping": True,
+        "pool_recycle": 1800,
+        # The scheduler sends notifications from its own thread
+        "connect_args": {"check_same_thread": False},
+    }
     app.config["MAIL_SERVER"] = "smtp.gmail.com"
     app.config["MAIL_PORT"] = 587  # TLS PORT FOR GMAIL
     app.config["MAIL_USE_TLS"] = True
@@ -41,6 +52,7 @@ def create_app():
     try and bypass git commit
     """
     from .models import User
+    from .helper_functions import legacy_hashes_remain, send_due_notifications
     from .views import views_blueprint
     from .authentication_page_routing import authentication_blueprint
     from .reservation_page_routing import reservation_blueprint
@@ -54,21 +66,100 @@ def create_app():
     app.register_blueprint(user_blueprint, url_prefix="/user")
 
     create_database(app)
+    with app.app_context():
+        # Checked once at startup, logins keep matching the pbkdf2 cost until a restart
+        # after the last legacy hash has been rehashed
+        app.config["LEGACY_HASHES_REMAIN"] = legacy_hashes_remain()
+
+    scheduler.add_job(
+        id="send_due_notifications",
+        func=send_due_notifications,
+        trigger="interval",
+        seconds=30,
+        replace_existing=True,
+    )
+
+    # A single timestamp per request so every check within it agrees on the current time
+    @app.before_request
+    def set_request_time():
+        g.now = datetime.now()
+
+    # One transaction per request, committed once the view has finished
+    @app.after_request
+    def commit_session(response):
+        try:
+            database.session.commit()
+        except Exception as e:
+            database.session.rollback()
+            flash(f"Error saving changes:  {str(e)}", category="error")
+        else:
+            for message, category in g.get("pending_flashes", []):
+                flash(message, category=category)
+        return response
+
+    @app.teardown_request
+    def rollback_session(exception):
+        if exception is not None:
+            database.session.rollback()
 
     login_manager.login_view = "authentication.login_page"
     login_manager.init_app(app)
 
-    # Links login_manager user to the User database
+    # Links login_manager user to the User database. Each request gets a fresh session, so
+    # this is still one primary key SELECT per request; current_user is kept as a real row
+    # rather than rebuilt from the cookie so demoted or deleted users take effect immediately
     @login_manager.user_loader
     def load_user(id):
-        return User.query.get(id)
+        return database.session.get(User, int(id))
 
     return app
 
 
+@event.listens_for(Engine, "connect")
+def set_sqlite_pragma(dbapi_connection, connection_record):
+    """
+    Enables write-ahead logging on SQLite connections so scheduler writes don't block reads.
+    """
+    if isinstance(dbapi_connection, SQLiteConnection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.close()
+
+
 def create_database(app):
 
-    if not path.exists("QaProjectAgile/" + DATABASE_NAME):
-        with app.app_context():
+    with app.app_context():
+        # One lookup of the existing table names instead of a check per table
+        existing_tables = set(inspect(database.engine).get_table_names())
+        if not set(database.metadata.tables).issubset(existing_tables):
             database.create_all()
-        print("Created Database!")
+            print("Created Database!")
+
+        # Databases created before User.reservation_count existed get the column added
+        # and filled in from their existing reservations
+        user_columns = {
+            column["name"] for column in inspect(database.engine).get_columns("user")
+        }
+        if "reservation_count" not in user_columns:
+            with database.engine.begin() as connection:
+                connection.execute(
+                    text(
+                        'ALTER TABLE "user" ADD COLUMN reservation_count '
+                        "INTEGER NOT NULL DEFAULT 0"
+                    )
+                )
+                connection.execute(
+                    text(
+                        'UPDATE "user" SET reservation_count = (SELECT COUNT(*) '
+                        'FROM reservation WHERE reservation.username = "user".username)'
+                    )
+                )
+            print("Added reservation counts to Database!")
+
+        # create_all skips tables that already exist, so indexes added to the models
+        # later are created here for databases made before them
+        with database.engine.begin() as connection:
+            for table in database.metadata.sorted_tables:
+                for index in table.indexes:
+                    index.create(bind=connection, checkfirst=True)
@@ -2,11 +2,17 @@
 This module handles the authentication-related routes for the Flask web application.
 """
 
-import re
 from flask import Blueprint, render_template, request, flash, redirect, url_for
-from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import login_user, login_required, logout_user, current_user
-from .helper_functions import check_if_user_exists_from_username, table_create_item
+from .helper_functions import (
+    DUMMY_HASH,
+    EMAIL_RE,
+    check_if_user_exists_from_username,
+    hash_secret,
+    secret_needs_rehash,
+    table_create_item,
+    verify_password_and_pin,
+)
 from .models import User
 
 authentication_blueprint = Blueprint("authentication", __name__)
@@ -19,7 +25,9 @@ def login_page():
 
     GET: Renders the login page.
     POST: Checks if the provided username exists, and if the password and security pin are correct.
-          If authenticated, logs the user in and redirects to the home page.
+          The same hashing work is done whether or not the username exists.
+          If authenticated, upgrades any legacy hashes, logs the user in and redirects to
+          the home page.
           If credentials are incorrect, flashes an error message.
     """
     if request.method == "POST":
@@ -27,16 +35,23 @@ def login_page():
         password = request.form.get("password")
         security_pin = request.form.get("pin")
         user = User.query.filter_by(username=username).first()
-        if user:
-            if check_password_hash(user.password, password) and check_password_hash(
-                user.security_pin, security_pin
+        # Both checks always run so response time does not reveal which usernames exist
+        credentials_match = verify_password_and_pin(
+            user.password if user else DUMMY_HASH,
+            password,
+            user.security_pin if user else DUMMY_HASH,
+            security_pin,
+        )
+        if user and credentials_match:
+            if secret_needs_rehash(user.password) or secret_needs_rehash(
+                user.security_pin
             ):
-                flash("Logged in successfully", category="success")
-                login_user(user, remember=True)
-                return redirect(url_for("views.home"))
-            flash("Incorrect credentials, try again", category="error")
-        else:
-            flash("Please enter a valid username", category="error")
+                user.password = hash_secret(password)
+                user.security_pin = hash_secret(security_pin)
+            flash("Logged in successfully", category="success")
+            login_user(user, remember=True)
+            return redirect(url_for("views.home"))
+        flash("Incorrect credentials, try again", category="error")
     return render_template("login.html", text="Testing login page", user=current_user)
 
 
@@ -72,20 +87,20 @@ def signup_page():
         else:
             if len(password) < 7:
                 flash("Password must be greater than 7 characters", category="error")
-            elif not re.search(r"[^@]+@[^@]+\.[^@]+", email):
+            elif not EMAIL_RE.match(email):
                 flash("Enter a valid email", category="error")
             elif len(username) < 1:
                 flash("Username must contain at least 1 character", category="error")
-            elif int(security_pin) < 9999999:
+            elif not (
+                security_pin and security_pin.isdigit() and len(security_pin) >= 8
+            ):
                 flash("Security pin must contain at least 8 digits", category="error")
             else:
                 new_user = User(
                     email_address=email,
                     username=username,
-                    password=generate_password_hash(password, method="pbkdf2:sha256"),
-                    security_pin=generate_password_hash(
-                        security_pin, method="pbkdf2:sha256"
-                    ),
+                    password=hash_secret(password),
+                    security_pin=hash_secret(security_pin),
                     administrator=True,
                 )
                 success_message = "Account created!"
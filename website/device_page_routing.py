@@ -3,11 +3,14 @@ This module handles the routes related to device management, including CRUD oper
 (create, read, update, and delete) for devices in the system.
 """
 
-from datetime import datetime
-from flask import Blueprint, request, render_template, flash, redirect, url_for
+from flask import Blueprint, request, render_template, flash, redirect, url_for, g
 from flask_login import login_required, current_user
-from .models import Device, Reservation
+from sqlalchemy import func
+from sqlalchemy.orm import load_only
+from . import database
+from .models import Device, Reservation, Notification, change_reservation_count
 from .helper_functions import (
+    admin_required,
     format_time,
     table_create_item,
     table_delete_item,
@@ -16,31 +19,41 @@ from .helper_functions import (
 
 device_blueprint = Blueprint("device", __name__)
 
+# Used where only the device's id and name are needed
+DEVICE_NAME_ONLY = load_only(Device.id, Device.device_name)
+
 
 @device_blueprint.route("/", methods=["GET", "POST"])
 @login_required
 def home():
     """
     Handles the default page for device management
-    GET: Queries the database to fetch all device entries and renders the `read_device.html` page
-         to display the devices.
+    GET: Queries the database to fetch all device entries along with their reservation counts
+         in a single query and renders the `read_device.html` page to display the devices.
     POST: If sent with the 'DELETE' method then it will check if the device exists and then render
           a confirm delete page if there are any reservations tied to that device.
 
 
     """
     if request.method == "GET":
-        all_devices = Device.query.all()
+        rows = (
+            database.session.query(Device, func.count(Reservation.id))
+            .outerjoin(Reservation, Reservation.device_id == Device.id)
+            .group_by(Device.id)
+            .all()
+        )
         return render_template(
-            "read_device.html", user=current_user, devices=all_devices
+            "read_device.html",
+            user=current_user,
+            devices=[(device, reservation_count) for device, reservation_count in rows],
         )
     if (
         request.method == "POST"
-        and request.form.get("_method") == "DELETE"
         and current_user.administrator
+        and request.form.get("_method") == "DELETE"
     ):
         device_id = request.form.get("device_id")
-        device = Device.query.get(device_id)
+        device = database.session.get(Device, device_id, options=[DEVICE_NAME_ONLY])
 
         if not device:
             flash("Device not found.", category="error")
@@ -60,28 +73,48 @@ def home():
 
 @device_blueprint.route("/confirm_delete", methods=["POST"])
 @login_required
+@admin_required
 def confirm_delete():
     """
     Confirms that the administrator user wants to delete the device.
-    POST: Deletes the chosen device if the device is found
+    POST: Deletes the chosen device and its reservations if the device is found
           and the administrator user has confirmed 'yes'.
     """
     device_id = request.form.get("device_id")
-    device = Device.query.get(device_id)
+    device = database.session.get(Device, device_id, options=[DEVICE_NAME_ONLY])
     confirm = request.form.get("confirm")
 
     if not device:
         flash("Device not found.", category="error")
         return redirect(url_for("device.home"))
 
-    if confirm == "yes" and current_user.administrator:
-        # Admin confirmed, delete device
+    if confirm == "yes":
+        # Admin confirmed, delete device and its reservations in a single statement each
+        # since SQLite does not enforce the ON DELETE CASCADE foreign keys by default.
+        # Notifications go first so none are left pointing at a reused reservation id
+        device_reservation_ids = database.session.query(Reservation.id).filter_by(
+            device_id=device.id
+        )
+        Notification.query.filter(
+            Notification.reservation_id.in_(device_reservation_ids.scalar_subquery())
+        ).delete(synchronize_session=False)
+        # Bulk deletes skip the reservation listeners, so each affected user's count is
+        # lowered here with one UPDATE per user
+        reservation_counts = (
+            database.session.query(Reservation.username, func.count(Reservation.id))
+            .filter_by(device_id=device.id)
+            .group_by(Reservation.username)
+        )
+        for username, reservation_count in reservation_counts.all():
+            change_reservation_count(
+                database.session.connection(), username, -reservation_count
+            )
+        Reservation.query.filter_by(device_id=device.id).delete(
+            synchronize_session=False
+        )
         success_message = f"Device {device.device_name} has been deleted successfully."
         error_message = f"Error deleting Device {device.device_name}:"
         table_delete_item(device, success_message, error_message)
-
-    elif not current_user.administrator:
-        flash("You are not administrator", category="error")
     else:
         flash(f"Deletion of device {device.device_name} was canceled.", category="info")
 
@@ -93,7 +126,7 @@ def confirm_delete():
 def see_availability():
     """
     Displays a devices availability.
-    POST: Loops throught all reservations assigned to a specific device id and
+    POST: Fetches the upcoming reservations assigned to a specific device id and
           appends the availabilty between the end time of a reservation and
           the next reservations start time.
     """
@@ -102,12 +135,12 @@ def see_availability():
         flash("Device ID not provided.", category="error")
         return redirect(url_for("device.home"))
 
-    device = Device.query.get(device_id)
+    device = database.session.get(Device, device_id, options=[DEVICE_NAME_ONLY])
 
     if not device:
         flash("Device not found.", category="error")
         return redirect(url_for("device.home"))
-    now = datetime.now()
+    now = g.now
     reservations = (
         Reservation.query.filter_by(device_id=device_id)
         .filter(Reservation.start_time > now)
@@ -115,36 +148,19 @@ def see_availability():
         .all()
     )
 
+    # The reservations are already loaded for the page, so the gaps between them are
+    # found in one pass over that list rather than a second query
     availability_slots = []
+    slot_start = now
+    for reservation in reservations:
+        if slot_start < reservation.start_time:
+            availability_slots.append(
+                {"start": slot_start, "end": reservation.start_time}
+            )
+        slot_start = max(slot_start, reservation.end_time)
 
-    # Start of the availability: Before the first reservation
-    if reservations:
-        if now < reservations[0].start_time:
-            availability_slots.append({"start": now, "end": reservations[0].start_time})
-            # Check gaps between reservations
-        for i in range(len(reservations) - 1):
-            end_of_current_reservation = reservations[i].end_time
-            start_of_next_reservation = reservations[i + 1].start_time
-
-            if end_of_current_reservation < start_of_next_reservation:
-                availability_slots.append(
-                    {
-                        "start": end_of_current_reservation,
-                        "end": start_of_next_reservation,
-                    }
-                )
-
-        availability_slots.append(
-            {
-                "start": reservations[-1].end_time,
-                "end": None,  # Available indefinitely after the last reservation
-            }
-        )
-    else:
-        # If no reservations, the device is fully available from now
-        availability_slots.append(
-            {"start": now, "end": None}  # No end time, fully available
-        )
+    # Available indefinitely after the last reservation, or from now if there are none
+    availability_slots.append({"start": slot_start, "end": None})
 
     return render_template(
         "see_device_availability.html",
@@ -157,6 +173,7 @@ def see_availability():
 
 @device_blueprint.route("/update", methods=["GET", "POST"])
 @login_required
+@admin_required
 def update():
     """
     Updates device information based on user input.
@@ -168,13 +185,13 @@ def update():
         flash("Device ID not provided.", category="error")
         return redirect(url_for("device.home"))
 
-    device = Device.query.get(device_id)
+    device = database.session.get(Device, device_id)
 
     if not device:
         flash("Device not found.", category="error")
         return redirect(url_for("device.home"))
 
-    if request.method == "POST" and current_user.administrator:
+    if request.method == "POST":
         device_fields = (
             "device_name",
             "device_brand",
@@ -186,7 +203,7 @@ def update():
             value = request.form.get(device_field)
             if device_field == "last_use" and value:
                 value = format_time(value)
-                if value > datetime.now():
+                if value > g.now:
                     flash(
                         "The last use of a device can not be in the future",
                         category="info",
@@ -194,26 +211,24 @@ def update():
                     value = None
 
             if device_field == "device_name" and value:
-                all_current_device_reservations = Reservation.query.filter_by(
+                # Renames every reservation for the device in a single UPDATE
+                database.session.query(Reservation).filter_by(
                     device_id=device_id
-                ).all()
-                for reservation in all_current_device_reservations:
-                    reservation.device_name = value
-                    setattr(device, device_field, value)
+                ).update({Reservation.device_name: value}, synchronize_session=False)
+            if value:
+                setattr(device, device_field, value)
         success_message = f"Device {device.device_name} updated successfully!"
         error_message = "Error updating device:"
         if table_update_item(success_message, error_message):
             return redirect(url_for("device.home"))
         return redirect(url_for("device.update", device_id=device.id))
 
-    if not current_user.administrator:
-        flash("You are not administrator", category="error")
-        return redirect(url_for("device.home"))
     return render_template("update_device.html", device=device, user=current_user)
 
 
 @device_blueprint.route("/create", methods=["GET", "POST"])
 @login_required
+@admin_required
 def create():
     """
     Creates a new device and adds it to the system.
@@ -221,7 +236,7 @@ def create():
     POST: Allows an administrator to create a new device by providing details such as
           the device name, brand, status, and type. The new device is saved to the database.
     """
-    if request.method == "POST" and current_user.administrator:
+    if request.method == "POST":
         device_name = request.form.get("device_name")
         device_brand = request.form.get("device_brand")
         device_status = request.form.get("device_status")
@@ -239,8 +254,5 @@ def create():
         if table_create_item(new_device, success_message, error_message):
             return redirect(url_for("device.home"))
         return redirect(url_for("device.create"))
-    if not current_user.administrator:
-        flash("You are not administrator", category="error")
-        return redirect(url_for("device.home"))
 
     return render_template("create_device.html", user=current_user)
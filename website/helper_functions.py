@@ -4,45 +4,184 @@ deleting records, and updating records in database tables. It uses SQLAlchemy fo
 database interaction and Flask for user feedback through flash messages.
 """
 
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
-from flask import flash
+from functools import wraps
+from smtplib import SMTPException, SMTPRecipientsRefused
+from argon2 import PasswordHasher
+from argon2.exceptions import InvalidHashError, VerificationError
+from flask import current_app, flash, g, redirect, session, url_for
 from flask_login import current_user
 from flask_mail import Message
-from . import scheduler, database
-from .models import Reservation, User, Device
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import joinedload
+from werkzeug.security import check_password_hash, generate_password_hash
+from . import scheduler, database, mail
+from .models import Reservation, User, Device, Notification
+
+# Compiled once at import. Domain labels can not contain dots, so each character of the domain
+# can only match one way and inputs like "a@a.a.a.a@" are rejected in linear time
+EMAIL_RE = re.compile(r"\A[^@\s]+@[^@\s.]+(?:\.[^@\s.]+)+\Z")
+# Argon2id with a fixed cost so hashing time stays predictable across library upgrades
+password_hasher = PasswordHasher(time_cost=2, memory_cost=64 * 1024, parallelism=1)
+LEGACY_HASH_PREFIX = "pbkdf2:"
+# How long a re-authentication lasts before settings require it again
+AUTH_TIMEOUT_SECONDS = 15 * 60
+# Hashed at import so the hasher is warmed up before the first login, and verified against
+# when a username does not exist so every login attempt costs the same
+DUMMY_HASH = password_hasher.hash("warmup")
+# Same method and werkzeug default iterations as the hashes stored before Argon2id
+LEGACY_DUMMY_HASH = generate_password_hash("warmup", method="pbkdf2:sha256")
 
 
 def format_time(time):
     """
     Converts a string representation of a date and time to a `datetime` object.
+    Uses the C implemented ISO 8601 parser rather than interpreting a format string.
     Args:
         time (str): The string representation of the time in the format "%Y-%m-%dT%H:%M".
     """
-    return datetime.strptime(time, "%Y-%m-%dT%H:%M")
+    return datetime.fromisoformat(time)
 
 
-def check_if_device_is_available(device_id, start_time, end_time):
+def admin_required(view):
     """
-    Checks whether a device is available for the given time period by ensuring
-    there are no overlapping reservations for that device.
+    Decorator that redirects users who are not administrators before the view runs,
+    so unauthorised requests never reach the database.
     """
-    all_reservations_for_device = Reservation.query.filter_by(device_id=device_id)
-    for reservation in all_reservations_for_device:
-        # If the new reservation does not overlap with this reservation, continue
-        if (reservation.start_time > end_time) or (reservation.end_time < start_time):
-            continue
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if not (current_user.is_authenticated and current_user.administrator):
+            flash("You are not administrator", category="error")
+            return redirect(url_for("views.home"))
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def requires_recent_auth(view):
+    """
+    Decorator that sends users to re-authenticate if they have not done so in the last
+    15 minutes before the view runs.
+    """
+
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        last_auth_time = session.get("last_auth_time")
+        if not last_auth_time or time.time() - last_auth_time > AUTH_TIMEOUT_SECONDS:
+            flash("Please re-authenticate to change your settings.", category="warning")
+            return redirect(url_for("user.reauthenticate"))
+        return view(*args, **kwargs)
+
+    return wrapper
+
+
+def hash_secret(secret):
+    """
+    Hashes a password or security pin with Argon2id.
+    """
+    return password_hasher.hash(secret)
+
+
+def verify_secret(secret_hash, secret, match_legacy_cost=False):
+    """
+    Checks a password or security pin against its stored hash.
+    Hashes created before the move to Argon2id are checked with werkzeug's pbkdf2 verifier.
+    With match_legacy_cost, the hasher not used is also run against its dummy hash so
+    pbkdf2 and Argon2id hashes take the same time to check.
+    """
+    if not secret:
+        # A missing secret never matches, but is still checked against the dummy hash so it
+        # is not quicker to reject than a wrong one
+        secret_hash, secret = DUMMY_HASH, ""
+    is_legacy = secret_hash.startswith(LEGACY_HASH_PREFIX)
+    if match_legacy_cost:
+        if is_legacy:
+            verify_secret(DUMMY_HASH, secret)
+        else:
+            check_password_hash(LEGACY_DUMMY_HASH, secret)
+    if is_legacy:
+        return check_password_hash(secret_hash, secret)
+    try:
+        return password_hasher.verify(secret_hash, secret)
+    except (VerificationError, InvalidHashError):
         return False
-    return True
 
 
-def send_reservation_email(email, reservation):
+def verify_password_and_pin(password_hash, password, pin_hash, pin):
+    """
+    Checks a password and security pin against their stored hashes.
+    The pin is verified on a second thread while the password is verified on this one,
+    both hashers release the GIL so the checks overlap on multi-core machines.
+    While any user still has a pbkdf2 hash, both hashers run for every check so legacy
+    accounts can not be told apart from other or unknown usernames by timing.
+    """
+    match_legacy_cost = current_app.config.get("LEGACY_HASHES_REMAIN", True)
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        pin_check = executor.submit(verify_secret, pin_hash, pin, match_legacy_cost)
+        password_matches = verify_secret(password_hash, password, match_legacy_cost)
+        pin_matches = pin_check.result()
+    return password_matches and pin_matches
+
+
+def legacy_hashes_remain():
+    """
+    Checks if any user still has a pbkdf2 password or security pin.
+    """
+    return database.session.query(
+        exists().where(
+            or_(
+                User.password.startswith(LEGACY_HASH_PREFIX),
+                User.security_pin.startswith(LEGACY_HASH_PREFIX),
+            )
+        )
+    ).scalar()
+
+
+def secret_needs_rehash(secret_hash):
+    """
+    Checks if a stored hash is a legacy pbkdf2 hash or uses outdated Argon2id parameters.
+    """
+    return secret_hash.startswith(
+        LEGACY_HASH_PREFIX
+    ) or password_hasher.check_needs_rehash(secret_hash)
+
+
+def get_device_if_available(device_id, start_time, end_time):
     """
-    Sends an email to the user with details about their upcoming reservation.
+    Fetches a device together with whether it has no overlapping reservations for the
+    given time period in a single query.
+    Returns (None, False) if the device does not exist.
+    """
+    no_overlapping_reservation = ~(
+        Reservation.query.filter(
+            Reservation.device_id == Device.id,
+            Reservation.start_time <= end_time,
+            Reservation.end_time >= start_time,
+        ).exists()
+    )
+    device_and_availability = (
+        database.session.query(Device, no_overlapping_reservation)
+        .filter(Device.id == device_id)
+        .first()
+    )
+    if not device_and_availability:
+        return None, False
+    return tuple(device_and_availability)
+
+
+def send_reservation_email(connection, email, reservation):
+    """
+    Sends an email to the user with details about their upcoming reservation
+    over an already open mail connection.
     """
     msg = Message(subject="Your Reservation is Confirmed!", recipients=[email])
 
     msg.body = f"""
-    Dear {current_user.username},
+    Dear {reservation.username},
 
     Your reservation for {reservation.device_name} has been confirmed.
 
@@ -58,31 +197,86 @@ def send_reservation_email(email, reservation):
     The Team
     """
 
-    email.send(msg)
+    connection.send(msg)
 
 
 def schedule_reservation_notification(reservation):
     """
-    Schedules a job to send an email notification 30 minutes before the reservation start time.
+    Stores a notification to be emailed 30 minutes before the reservation start time.
+    Notifications are kept in the database so pending emails survive a restart.
     """
-    notification_time = reservation.start_time - timedelta(minutes=30)
-    job_id = f"notify_user_{reservation.id}"
-
-    scheduler.add_job(
-        func=send_reservation_email,
-        trigger="date",
-        run_date=notification_time,
-        args=[current_user.email_address, reservation],
-        id=job_id,
-        replace_existing=True,
+    notification = Notification(
+        reservation=reservation,
+        email=current_user.email_address,
+        send_at=reservation.start_time - timedelta(minutes=30),
     )
+    database.session.add(notification)
+
+
+def send_due_notifications():
+    """
+    Sends every notification that is due over a single SMTP connection. Each notification
+    is claimed with a conditional UPDATE first, so when several processes run the scheduler
+    only the one whose UPDATE changed the row sends it. A notification that fails to send is
+    released for the next run without holding back the rest.
+    """
+    with scheduler.app.app_context():
+        due_notifications = (
+            Notification.query.options(joinedload(Notification.reservation))
+            .filter(Notification.sent.is_(False), Notification.send_at <= datetime.now())
+            .order_by(Notification.send_at)
+            .limit(100)
+            .all()
+        )
+        if not due_notifications:
+            return
+        claimed_notifications = [
+            notification
+            for notification in due_notifications
+            if database.session.query(Notification)
+            .filter(Notification.id == notification.id, Notification.sent.is_(False))
+            .update({Notification.sent: True}, synchronize_session=False)
+            == 1
+        ]
+        # Detached first so committing the claims does not expire the loaded reservations
+        database.session.expunge_all()
+        database.session.commit()
+        if not claimed_notifications:
+            return
+        handled_notification_ids = set()
+        try:
+            with mail.connect() as connection:
+                for notification in claimed_notifications:
+                    if notification.reservation:
+                        try:
+                            send_reservation_email(
+                                connection, notification.email, notification.reservation
+                            )
+                        except SMTPRecipientsRefused:
+                            # The address will never accept the email, so it is not retried
+                            pass
+                        except SMTPException:
+                            continue
+                    handled_notification_ids.add(notification.id)
+        finally:
+            # Released even if the connection fails part way so unsent emails are retried
+            unsent_notification_ids = [
+                notification.id
+                for notification in claimed_notifications
+                if notification.id not in handled_notification_ids
+            ]
+            if unsent_notification_ids:
+                database.session.query(Notification).filter(
+                    Notification.id.in_(unsent_notification_ids)
+                ).update({Notification.sent: False}, synchronize_session=False)
+                database.session.commit()
 
 
 def check_start_and_end_time(start_time, end_time):
     """
     Verifies that start and end time fit criteria
     """
-    time_now = datetime.now()
+    time_now = g.now
     if start_time < time_now or end_time < time_now:
         flash("You cannot schedule a reservation in the past.", category="error")
         return False
@@ -97,36 +291,34 @@ def check_if_user_exists_from_username(username):
     """
     Checks if the user exists throught their username
     """
-    user = User.query.filter_by(username=username).first()
-    if user:
-        return True
-    return False
-
-
-def check_if_device_exists_from_device_id(device_id):
-    """
-    Checks if the device exists throught their device id
-    """
-    device = Device.query.get(device_id)
-    if device:
-        return True
-    return False
+    return database.session.query(exists().where(User.username == username)).scalar()
 
 
 def check_availability_of_device_name(device_name, start_time, end_time):
     """
-    Checks the availability of all devices by their device name
+    Checks the availability of all devices by their device name and returns the id of the
+    first device with no overlapping reservations
     """
-    all_devices = Device.query.filter_by(device_name=device_name).all()
+    available_device = (
+        database.session.query(Device.id)
+        .outerjoin(
+            Reservation,
+            and_(
+                Reservation.device_id == Device.id,
+                Reservation.start_time <= end_time,
+                Reservation.end_time >= start_time,
+            ),
+        )
+        .filter(Device.device_name == device_name, Reservation.id.is_(None))
+        .first()
+    )
+    if available_device:
+        return available_device.id
 
-    if not all_devices:
+    if not Device.query.filter_by(device_name=device_name).first():
         flash(f"No devices found with the name {device_name}.", category="error")
         return False
 
-    for device in all_devices:
-        if check_if_device_is_available(device.id, start_time, end_time):
-            return device.id
-
     flash(
         "No devices are available with the specified name.",
         category="error",
@@ -134,13 +326,21 @@ def check_availability_of_device_name(device_name, start_time, end_time):
     return False
 
 
+def flash_after_commit(message, category):
+    """
+    Queues a flash message that is only shown once the request's transaction commits.
+    """
+    g.setdefault("pending_flashes", []).append((message, category))
+
+
 def table_update_item(success_message, error_message):
     """
-    Updates an item from the table and performs exception handling
+    Flushes pending updates to the table and performs exception handling.
+    The changes are committed when the request finishes.
     """
     try:
-        database.session.commit()
-        flash(success_message, category="success")
+        database.session.flush()
+        flash_after_commit(success_message, "success")
         return True
     except Exception as e:
         database.session.rollback()
@@ -150,12 +350,13 @@ def table_update_item(success_message, error_message):
 
 def table_create_item(item, success_message, error_message):
     """
-    Create an item in the table and performs exception handling
+    Create an item in the table and performs exception handling.
+    The item is committed when the request finishes.
     """
     try:
         database.session.add(item)
-        database.session.commit()
-        flash(success_message, category="success")
+        database.session.flush()
+        flash_after_commit(success_message, "success")
         return True
     except Exception as e:
         database.session.rollback()
@@ -165,12 +366,13 @@ def table_create_item(item, success_message, error_message):
 
 def table_delete_item(item, success_message, error_message):
     """
-    Deletes an item from the table and performs exception handling
+    Deletes an item from the table and performs exception handling.
+    The deletion is committed when the request finishes.
     """
     try:
         database.session.delete(item)
-        database.session.commit()
-        flash(success_message, category="success")
+        database.session.flush()
+        flash_after_commit(success_message, "success")
         return True
     except Exception as e:
         database.session.rollback()
@@ -1,10 +1,11 @@
 """
 This module defines the database models for the Flask web application. These models represent
-the User, Device, and Reservation entities in the system, and are used to handle CRUD operations 
+the User, Device, Reservation and Notification entities in the system, and are used to handle CRUD operations 
 and relationships in the database using SQLAlchemy.
 """
 
 from flask_login import UserMixin
+from sqlalchemy import event, inspect
 from . import database as db
 
 class User(db.Model, UserMixin):
@@ -16,16 +17,22 @@ class User(db.Model, UserMixin):
         username (str): The username of the user, must be unique.
         email_address (str): The email address associated with the user.
         password (str): The hashed password for the user's account.
-        security_pin (int): A hashed security pin used for additional authentication.
+        security_pin (str): A hashed security pin used for additional authentication.
         administrator (bool): A flag indicating if the user has admin privileges.
+        reservation_count (int): The number of reservations the user has, kept up to date by
+            the Reservation event listeners. Bulk deletes can leave it too high, so it is only
+            relied on to skip queries when it is zero.
     """
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    username = db.Column(db.String(150), unique=True)
+    username = db.Column(db.String(150), unique=True, index=True)
     email_address = db.Column(db.String(150))
-    password = db.Column(db.String(150))
-    security_pin = db.Column(db.Integer)
+    password = db.Column(db.String(255))
+    security_pin = db.Column(db.String(255))
     administrator = db.Column(db.Boolean)
+    reservation_count = db.Column(
+        db.Integer, default=0, server_default="0", nullable=False
+    )
 
 
 class Device(db.Model):
@@ -39,14 +46,22 @@ class Device(db.Model):
         device_status (str): The current status of the device (e.g., Active, inactive, maintenance).
         device_type (str): The type of the device (e.g., Laptop, Phone).
         last_use (datetime): The last recorded use of the device.
+        reservations (list): The reservations for the device, deleted along with it.
     """
 
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     device_brand = db.Column(db.String(150))
-    device_name = db.Column(db.String(150))
+    device_name = db.Column(db.String(150), index=True)
     device_status = db.Column(db.String(150))
     device_type = db.Column(db.String(150))
     last_use = db.Column(db.DateTime(timezone=True))
+    reservations = db.relationship(
+        "Reservation",
+        backref="device",
+        foreign_keys="Reservation.device_id",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+    )
 
 
 class Reservation(db.Model):
@@ -61,12 +76,82 @@ class Reservation(db.Model):
         start_time (datetime): The start time of the reservation.
         end_time (datetime): The end time of the reservation.
         reason (str): A business reason provided by the user for the reservation.
+        notifications (list): The email notifications scheduled for the reservation.
     """
 
+    # Availability checks filter on device_id and the time range, the home page filters on
+    # username and start_time. These also serve lookups on device_id or username alone
+    __table_args__ = (
+        db.Index(
+            "ix_reservation_device_time", "device_id", "start_time", "end_time"
+        ),
+        db.Index("ix_reservation_username_start", "username", "start_time"),
+    )
+
     id = db.Column(db.Integer, primary_key=True, autoincrement=True)
-    device_id = db.Column(db.Integer, db.ForeignKey("device.id"))
+    device_id = db.Column(
+        db.Integer, db.ForeignKey("device.id", ondelete="CASCADE")
+    )
     device_name = db.Column(db.String(150), db.ForeignKey("device.device_name"))
     username = db.Column(db.String(150), db.ForeignKey("user.username"))
     start_time = db.Column(db.DateTime(timezone=True))
     end_time = db.Column(db.DateTime(timezone=True))
     reason = db.Column(db.String(500))
+    notifications = db.relationship(
+        "Notification", backref="reservation", cascade="all, delete-orphan"
+    )
+
+
+class Notification(db.Model):
+    """
+    Represents a pending email notification about an upcoming reservation.
+
+    Attributes:
+        id (int): The primary key for the notification (auto-incremented).
+        reservation_id (int): The ID of the reservation, references the Reservation model.
+        email (str): The email address the notification is sent to.
+        send_at (datetime): The time at which the notification becomes due.
+        sent (bool): A flag indicating if the notification has been sent.
+    """
+
+    # The notification job polls for unsent notifications that are due
+    __table_args__ = (db.Index("ix_notification_sent_send_at", "sent", "send_at"),)
+
+    id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    reservation_id = db.Column(
+        db.Integer, db.ForeignKey("reservation.id", ondelete="CASCADE")
+    )
+    email = db.Column(db.String(150))
+    send_at = db.Column(db.DateTime(timezone=True))
+    sent = db.Column(db.Boolean, default=False, nullable=False)
+
+
+def change_reservation_count(connection, username, amount):
+    """
+    Adds the amount to the reservation count of the user with the given username.
+    """
+    if username:
+        connection.execute(
+            db.update(User)
+            .where(User.username == username)
+            .values(reservation_count=User.reservation_count + amount)
+        )
+
+
+@event.listens_for(Reservation, "after_insert")
+def increment_reservation_count(mapper, connection, target):
+    change_reservation_count(connection, target.username, 1)
+
+
+@event.listens_for(Reservation, "after_delete")
+def decrement_reservation_count(mapper, connection, target):
+    change_reservation_count(connection, target.username, -1)
+
+
+@event.listens_for(Reservation, "after_update")
+def move_reservation_count(mapper, connection, target):
+    username_history = inspect(target).attrs.username.history
+    if username_history.has_changes():
+        for old_username in username_history.deleted:
+            change_reservation_count(connection, old_username, -1)
+        change_reservation_count(connection, target.username, 1)
@@ -6,15 +6,16 @@ updating, and deleting reservations.
 from datetime import datetime
 from flask import Blueprint, request, render_template, flash, redirect, url_for
 from flask_login import login_required, current_user
+from sqlalchemy.orm import raiseload
+from . import database
 from .models import Reservation, Device
 from .helper_functions import (
     format_time,
     schedule_reservation_notification,
-    check_if_device_is_available,
     check_start_and_end_time,
     check_if_user_exists_from_username,
-    check_if_device_exists_from_device_id,
     check_availability_of_device_name,
+    get_device_if_available,
     table_create_item,
     table_update_item,
     table_delete_item,
@@ -22,14 +23,17 @@ from .helper_functions import (
 
 reservation_blueprint = Blueprint("reservation", __name__)
 
+RESERVATIONS_PER_PAGE = 50
+
 
 @reservation_blueprint.route("/", methods=["GET", "POST"])
 @login_required
 def home():
     """
     Handles the default page for reservation management.
-    GET: Queries the database to fetch all reservations entries and
+    GET: Queries the database to fetch a page of reservations entries and
          renders the `read_reservation.html` page to display the reservation.
+         Relationships are never lazy loaded so the page can not issue a query per row.
     POST: If sent with the 'DELETE' method then it will check if the reservation exists and then
           deletes the reservation if the user is administrator or if it was their own reservation.
 
@@ -37,27 +41,32 @@ def home():
     if request.method == "GET":
         # Checks whether user requests to see all devices or just their own (only for administrator user)
         show_all = request.args.get("show_all", default="false").lower() == "true"
+        reservations = Reservation.query.options(raiseload("*"))
         if current_user.administrator and show_all:
-            reservations = Reservation.query.all()
             flash("Displaying all users' reservations", category="info")
         else:
-            reservations = Reservation.query.filter_by(
-                username=current_user.username
-            ).all()
+            reservations = reservations.filter_by(username=current_user.username)
             if current_user.administrator:
                 flash(
                     "Displaying only your reservations. Toggle to see all reservations.",
                     category="info",
                 )
+        # Only one page of reservations is loaded and rendered at a time
+        pagination = reservations.order_by(Reservation.start_time.desc()).paginate(
+            page=request.args.get("page", default=1, type=int),
+            per_page=RESERVATIONS_PER_PAGE,
+            error_out=False,
+        )
         return render_template(
             "read_reservation.html",
             user=current_user,
-            reservations=reservations,
+            reservations=pagination.items,
+            pagination=pagination,
             show_all=show_all,
         )
     if request.method == "POST" and request.form.get("_method") == "DELETE":
         reservation_id = request.form.get("reservation_id")
-        reservation = Reservation.query.get(reservation_id)
+        reservation = database.session.get(Reservation, reservation_id)
         if not reservation:
             flash("Reservation not found.", category="error")
             return redirect(url_for("reservation.home"))
@@ -110,18 +119,18 @@ def create():
 
         # Device availability validation
         if device_id:
-            if not check_if_device_is_available(device_id, start_time, end_time):
+            device, device_available = get_device_if_available(
+                device_id, start_time, end_time
+            )
+            if not device:
+                flash("Device not found.", category="error")
+                return redirect(url_for("reservation.home"))
+            if not device_available:
                 flash(
                     "The selected device is not available at this time.",
                     category="error",
                 )
                 return redirect(url_for("reservation.create"))
-            device = Device.query.filter_by(id=device_id).first()
-            if not device:
-                flash("Device not found.", category="error")
-                return redirect(url_for("reservation.home"))
-            device_name = device.device_name
-
         else:
             # Look for devices matching device_name and check availability
             device_id = check_availability_of_device_name(
@@ -133,8 +142,8 @@ def create():
             if not check_if_user_exists_from_username(current_user.username):
                 flash("Username not does exist", category="error")
                 return redirect(url_for("reservation.create"))
+            device = database.session.get(Device, device_id)
 
-        device = Device.query.filter_by(id=device_id).first()
         new_reservation = Reservation(
             device_id=device_id,
             device_name=device.device_name,
@@ -143,10 +152,11 @@ def create():
             end_time=end_time,
             reason=reason,
         )
-        schedule_reservation_notification(new_reservation)
         success_message = "Reservation created successfully!"
         error_message = "Error creating reservation:"
         if table_create_item(new_reservation, success_message, error_message):
+            # Only queues a notification row, the email is sent later by the scheduler
+            schedule_reservation_notification(new_reservation)
             return redirect(url_for("reservation.home"))
         return redirect(url_for("reservation.create"))
     return render_template("create_reservation.html", user=current_user)
@@ -166,7 +176,7 @@ def update():
     if not reservation_id:
         flash("Reservation ID not provided.", category="error")
         return redirect(url_for("reservation.home"))
-    reservation = Reservation.query.get(reservation_id)
+    reservation = database.session.get(Reservation, reservation_id)
     if not reservation:
         flash("Reservation not found.", category="error")
         return redirect(url_for("reservation.home"))
@@ -212,14 +222,17 @@ def update():
                 return url_for("reservation.update", reservation=reservation)
             reservation.device_name = device_name
         if device_id:
-            if not check_if_device_exists_from_device_id(device_id):
+            device, device_available = get_device_if_available(
+                device_id, start_time, end_time
+            )
+            if not device:
                 flash("Device does not exist", category="error")
                 return url_for("reservation.update", reservation=reservation)
-            if check_if_device_is_available(device_id, start_time, end_time):
-                reservation.device_id = device_id
-            else:
+            if not device_available:
                 flash("Device is not available for this time", category="error")
                 return url_for("reservation.update", reservation=reservation)
+            reservation.device_id = device.id
+            reservation.device_name = device.device_name
         success_message = "Reservation updated successfully!"
         error_message = "Error updating reservation:"
         if table_update_item(success_message, error_message):
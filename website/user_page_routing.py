@@ -3,15 +3,19 @@ This modules handles user management including the user settings , delete and up
 read operations on all users.
 """
 
-import re
-from datetime import datetime
+import time
 from flask import Blueprint, render_template, request, flash, redirect, url_for, session
 from flask_login import login_required, current_user, login_user
-from werkzeug.security import check_password_hash, generate_password_hash
+from . import database
 from .helper_functions import (
+    EMAIL_RE,
+    admin_required,
     check_if_user_exists_from_username,
+    hash_secret,
+    requires_recent_auth,
     table_delete_item,
     table_update_item,
+    verify_password_and_pin,
 )
 from .models import User, Reservation
 
@@ -21,26 +25,18 @@ user_blueprint = Blueprint("user", __name__)
 
 @user_blueprint.route("/", methods=["GET", "POST"])
 @login_required
+@requires_recent_auth
 def user_settings():
     """
     Displays and handles updates to user settings (username, email, password, and security pin).
     Requires re-authentication before making changes.
     """
-    auth_timeout = 15  # in minutes
-    last_auth_time = session.get("last_auth_time")
-    if (
-        not last_auth_time
-        or (datetime.now() - datetime.fromtimestamp(last_auth_time)).total_seconds()
-        > auth_timeout * 60
-    ):
-        flash("Please re-authenticate to change your settings.", category="warning")
-        return redirect(url_for("user.reauthenticate"))
-
     return render_template("user_settings.html", user=current_user)
 
 
 @user_blueprint.route("/update", methods=["GET", "POST"])
 @login_required
+@requires_recent_auth
 def change_details():
     """
     Updates the details of the user based on their input.
@@ -48,15 +44,6 @@ def change_details():
     POST: Allows a user to update the details of their own user, such as
           the password, security pin, email, or username.
     """
-    auth_timeout = 15  # in minutes
-    last_auth_time = session.get("last_auth_time")
-    if (
-        not last_auth_time
-        or (datetime.now() - datetime.fromtimestamp(last_auth_time)).total_seconds()
-        > auth_timeout * 60
-    ):
-        flash("Please re-authenticate to change your settings.", category="warning")
-        return redirect(url_for("user.reauthenticate"))
     if request.method == "POST":
         # Update password
 
@@ -70,9 +57,7 @@ def change_details():
             if new_password != confirm_password:
                 flash("New password and confirmation do not match.", category="error")
                 return redirect(url_for("user.user_settings"))
-            current_user.password = generate_password_hash(
-                new_password, method="pbkdf2:sha256"
-            )
+            current_user.password = hash_secret(new_password)
 
         # Update username
         new_username = request.form.get("username")
@@ -87,18 +72,17 @@ def change_details():
                     "Username already taken. Please choose another.", category="error"
                 )
                 return redirect(url_for("user.user_settings"))
-            all_current_user_reservations = Reservation.query.filter_by(
+            # Renames every reservation for the user in a single UPDATE
+            database.session.query(Reservation).filter_by(
                 username=current_user.username
-            ).all()
-            for reservation in all_current_user_reservations:
-                reservation.username = new_username
+            ).update({Reservation.username: new_username}, synchronize_session=False)
             current_user.username = new_username
 
         # Update email
 
         new_email = request.form.get("email")
         if new_email and new_email != current_user.email_address:
-            if not re.search(r"[^@]+@[^@]+\.[^@]+", new_email):
+            if not EMAIL_RE.match(new_email):
                 flash("Enter a valid email.", category="error")
                 return redirect(url_for("user.user_settings"))
             current_user.email_address = new_email
@@ -116,9 +100,7 @@ def change_details():
                 return redirect(url_for("user.user_settings"))
 
             # Hash the new security pin and update
-            current_user.security_pin = generate_password_hash(
-                new_security_pin, method="pbkdf2:sha256"
-            )
+            current_user.security_pin = hash_secret(new_security_pin)
         success_message = "Your details have been updated successfully!"
         error_message = "Error updating user:"
         if table_update_item(success_message, error_message):
@@ -144,16 +126,12 @@ def reauthenticate():
         password = request.form.get("password")
         pin = request.form.get("pin")
         # Re-authentication check
-        if not check_password_hash(current_user.password, password):
+        if not verify_password_and_pin(
+            current_user.password, password, current_user.security_pin, pin
+        ):
             flash("Incorrect credentials. Please try again.", category="error")
             return redirect(url_for("user.reauthenticate"))
-
-        if not check_password_hash(current_user.security_pin, pin):
-            flash(
-                "Incorrect credentials. Please try again.", category="error"
-            )
-            return redirect(url_for("user.reauthenticate"))
-        session["last_auth_time"] = datetime.now().timestamp()
+        session["last_auth_time"] = time.time()
         return redirect(url_for("user.user_settings"))
 
     return render_template("user_settings_reauthenticate.html", user=current_user)
@@ -161,66 +139,53 @@ def reauthenticate():
 
 @user_blueprint.route("/delete", methods=["POST"])
 @login_required
+@requires_recent_auth
 def delete_account():
     """
     Deletes the account of the current user.
-    POST: Checks if the current 'user_id' exists and if it does then deletes that account and
-          redirects the user to the login/signup page.
+    POST: Deletes the account of the logged in user and redirects the user to the
+          login/signup page.
 
     """
-    auth_timeout = 15  # in minutes
-    last_auth_time = session.get("last_auth_time")
     if not current_user.administrator:
         flash("You are not administrator", category="error")
-        redirect(url_for("views.home"))
-    if (
-        not last_auth_time
-        or (datetime.now() - datetime.fromtimestamp(last_auth_time)).total_seconds()
-        > auth_timeout * 60
-    ):
-        flash("Please re-authenticate to change your settings.", category="warning")
-        return redirect(url_for("user.reauthenticate"))
+        return redirect(url_for("views.home"))
     if request.method == "POST" and request.form.get("_method") == "DELETE":
-        user_id = current_user.id
-
-        user = User.query.filter_by(id=user_id).one()
-        username = user.username
-        # Ensures that user exists in table
-        if not user:
-            flash("User does not exist in system", category="error")
-            return redirect(url_for("user.user_settings"))
-        success_message = f"User {username} successfully deleted!"
+        # Flask-Login has already loaded the user row for this request
+        user = current_user._get_current_object()
+        success_message = f"User {user.username} successfully deleted!"
         error_message = "Error deleting account:"
         if table_delete_item(user, success_message, error_message):
-            return redirect(url_for("auth.logout_page"))
+            return redirect(url_for("authentication.logout_page"))
     return redirect(url_for("views.home"))
 
 
 @user_blueprint.route("/admin", methods=["GET", "POST"])
 @login_required
+@admin_required
 def admin_view():
     """
     Handles the request for the administrator view page.
     GET: Queries the database to fetch all user entries and renders the `read_user.html` page
          to display the users.
-    POST: If the chosen user exists in the database  and the current user is administrator then
-          promote the chosen user to administrator.
+    POST: If the chosen user exists in the database then promote the chosen user to
+          administrator with a single UPDATE.
     """
 
-    if request.method == "GET" and current_user.administrator:
+    if request.method == "GET":
         all_users = User.query.all()
         return render_template("read_user.html", user=current_user, users=all_users)
-    if not current_user.administrator:
-        flash("You are not administrator", category="error")
-        redirect(url_for("views.home"))
-    if request.method == "POST" and current_user.administrator:
+    if request.method == "POST":
         user_id = request.form.get("user_id")
-        user = User.query.filter_by(id=user_id)
+        promoted_users = (
+            database.session.query(User)
+            .filter(User.id == user_id)
+            .update({User.administrator: True}, synchronize_session=False)
+        )
         # Ensures that user exists in table
-        if not user:
+        if not promoted_users:
             flash("User does not exist in system", category="error")
             return redirect(url_for("user.user_settings"))
-        user.administrator = True
         success_message = "User successfully promoted to administrator!"
         error_message = "Error making user administrator:"
         table_update_item(success_message, error_message)
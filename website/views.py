@@ -3,9 +3,9 @@ This module handles the view-related routes for the web application. It includes
 route for rendering the home page and differentiates between admin and standard users.
 """
 
-from datetime import datetime
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, g
 from flask_login import login_required, current_user
+from sqlalchemy.orm import raiseload
 from .models import Reservation
 
 views_blueprint = Blueprint("views", __name__)
@@ -17,19 +17,24 @@ def home():
     """
     Renders the home page based on the user's role (admin or standard user).
     """
-    user_reservations = Reservation.query.filter_by(
-        username=current_user.username
-    ).all()
-
-    # Check which reservations are ending within the next hour
-    now = datetime.now()
+    now = g.now
     current_reservations = []
     upcoming_reservations = []
-    for reservation in user_reservations:
-        if reservation.start_time < now < reservation.end_time:
-            current_reservations.append(reservation)
-        elif len(upcoming_reservations) < 3:
-            upcoming_reservations.append(reservation)
+    # Users without any reservations skip both queries
+    if current_user.reservation_count:
+        user_reservations = Reservation.query.options(raiseload("*")).filter(
+            Reservation.username == current_user.username
+        )
+        current_reservations = user_reservations.filter(
+            Reservation.start_time < now, Reservation.end_time > now
+        ).all()
+        # The next three reservations that have not started yet
+        upcoming_reservations = (
+            user_reservations.filter(Reservation.start_time > now)
+            .order_by(Reservation.start_time)
+            .limit(3)
+            .all()
+        )
     return render_template(
         "home.html",
         user=current_user,